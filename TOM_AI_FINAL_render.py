@@ -6,18 +6,105 @@ import json
 import numpy as np
 import math
 import os
+import sys
+import hmac
 import time
+import queue
+import signal
+import atexit
+import logging
+import logging.handlers
 import threading
 import requests
+from array import array
 import pandas as pd
 import ta
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from binance.client import Client
 from dotenv import load_dotenv
 
 # טעינת משתני סביבה (מקובץ .env בפיתוח מקומי, או מהגדרות Render בהפעלה בענן)
 load_dotenv()
 
+# === מערכת לוגים אסינכרונית ===
+# כל הכתיבה ל-stdout מתבצעת בתהליך רקע אחד; התהליכים של הסריקה וההזמנות רק מכניסים רשומה לתור
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# חלון זמן בשניות שבו כל הודעת סריקה (לפי מטבע ותבנית הודעה) נרשמת פעם אחת בלבד
+SCAN_LOG_INTERVAL_SEC = float(os.getenv("SCAN_LOG_INTERVAL_SEC", "900"))
+
+class JsonLogFormatter(logging.Formatter):
+    """עיצוב רשומת לוג כשורת JSON עם שדות מובנים"""
+    FIELDS = ('symbol', 'stage', 'latency_ms', 'order_id')
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage()
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class ScanRateLimitFilter(logging.Filter):
+    """הגבלת קצב להודעות סריקה בנפח גבוה - הודעה אחת לכל מטבע ותבנית בכל חלון זמן"""
+
+    def __init__(self, interval_sec):
+        super().__init__()
+        self.interval_sec = interval_sec
+        self.last_emitted = {}
+
+    def filter(self, record):
+        # רק הודעות סריקה רגילות מוגבלות; אזהרות ושגיאות תמיד עוברות
+        if getattr(record, 'stage', None) != 'scan' or record.levelno >= logging.WARNING:
+            return True
+        key = (getattr(record, 'symbol', None), record.msg)
+        now = time.monotonic()
+        last = self.last_emitted.get(key)
+        if last is not None and now - last < self.interval_sec:
+            return False
+        self.last_emitted[key] = now
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler שלעולם לא חוסם - כשהתור מלא הרשומה נזרקת ונספרת"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging():
+    """הגדרת הלוגר: תור חסום בגודל, תהליך רקע שכותב JSON ל-stdout והגבלת קצב להודעות סריקה"""
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ScanRateLimitFilter(SCAN_LOG_INTERVAL_SEC))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonLogFormatter())
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger("tom_ai")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    return logger
+
+log = setup_logging()
+
 # === הגדרת הקבועים הנדרשים מ-binance.enums ===
 SIDE_BUY = 'BUY'
 SIDE_SELL = 'SELL'
@@ -48,17 +135,37 @@ symbols_str = os.getenv("SYMBOLS", default_symbols)
 symbols = symbols_str.split(',')
 open_positions = {}
 
+# מרווח בשניות בין סבבי בדיקת TP/SL חסרים (ברירת מחדל: דקה)
+RECONCILE_INTERVAL_SEC = int(os.getenv("RECONCILE_INTERVAL_SEC", "60"))
+reconcile_lock = threading.Lock()
+reconcile_stats = {'runs': 0, 'last_duration_ms': 0, 'last_repairs': 0, 'total_repairs': 0}
+# מטבעות שנמצאים כרגע בפתיחה והגדרת TP/SL - סבב הבדיקה מדלג עליהם
+tp_sl_in_progress = set()
+
+# מטמון דיוק עשרוני לכל המטבעות - נטען פעם אחת מ-exchange info במקום בכל קריאה
+precision_cache = {}
+precision_lock = threading.Lock()
+
+def load_precision_cache():
+    """טעינת דיוק עשרוני לכל המטבעות בקריאה אחת ל-exchange info"""
+    info = client.futures_exchange_info()
+    cache = {}
+    for s in info['symbols']:
+        for f in s['filters']:
+            if f['filterType'] == 'LOT_SIZE':
+                cache[s['symbol']] = int(abs(round(np.log10(float(f['stepSize'])))))
+                break
+    with precision_lock:
+        precision_cache.update(cache)
+
 def get_precision(symbol):
     """קבלת דיוק עשרוני עבור המטבע"""
     try:
-        info = client.futures_exchange_info()
-        for s in info['symbols']:
-            if s['symbol'] == symbol:
-                for f in s['filters']:
-                    if f['filterType'] == 'LOT_SIZE':
-                        return int(abs(round(np.log10(float(f['stepSize'])))))
+        if symbol not in precision_cache:
+            load_precision_cache()
+        return precision_cache.get(symbol)
     except Exception as e:
-        print(f"שגיאה בשליפת precision עבור {symbol}: {e}")
+        log.warning("שגיאה בשליפת precision עבור %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'precision'})
         if symbol.startswith("BTC"):
             return 3
         elif symbol.startswith("ETH"):
@@ -78,7 +185,7 @@ def send_telegram_message(message):
     try:
         requests.post(url, data=payload)
     except Exception as e:
-        print(f"שגיאה בשליחת הודעת טלגרם: {e}")
+        log.warning("שגיאה בשליחת הודעת טלגרם: %s", e, extra={'stage': 'telegram'})
 
 def send_trade_open_notification(symbol, signal_data, quantity, leverage, mark_price):
     """שליחת התראה מפורטת על פתיחת עסקה"""
@@ -138,6 +245,8 @@ def setup_order_status_monitor(symbol):
         
         # בהפעלה בענן, אין אפשרות לכתוב לקבצים, אז נשמור את הנתונים בזיכרון
         global open_positions
+        # האיתות שפתח את הפוזיציה, לקישור התוצאה במאגר האיתותים
+        position_data['signal_id'] = open_positions.get('signal_links', {}).pop(symbol, None)
         if 'monitor_data' not in open_positions:
             open_positions['monitor_data'] = {}
         open_positions['monitor_data'][symbol] = position_data
@@ -145,13 +254,14 @@ def setup_order_status_monitor(symbol):
         # התחלת תהליך מעקב
         monitor_thread = threading.Thread(
             target=monitor_position_status,
-            args=(symbol,)
+            args=(symbol,),
+            name=f"monitor-{symbol}"
         )
         monitor_thread.daemon = True
         monitor_thread.start()
         
     except Exception as e:
-        print(f"שגיאה בהגדרת מעקב סטטוס: {e}")
+        log.error("שגיאה בהגדרת מעקב סטטוס: %s", e, extra={'symbol': symbol, 'stage': 'monitor'})
 
 def monitor_position_status(symbol):
     """מעקב אחרי סטטוס פוזיציה והתראה על סגירה"""
@@ -159,7 +269,7 @@ def monitor_position_status(symbol):
         # טעינת נתוני הפוזיציה מהזיכרון
         global open_positions
         if 'monitor_data' not in open_positions or symbol not in open_positions['monitor_data']:
-            print(f"לא נמצאו נתוני פוזיציה עבור {symbol}")
+            log.warning("לא נמצאו נתוני פוזיציה עבור %s", symbol, extra={'symbol': symbol, 'stage': 'monitor'})
             return
             
         position_data = open_positions['monitor_data'][symbol]
@@ -168,7 +278,12 @@ def monitor_position_status(symbol):
         
         # לולאת מעקב - בדיקה כל 30 שניות אם הפוזיציה עדיין קיימת
         while True:
-            time.sleep(30)
+            tracked_sleep(30, 'monitor_poll')
+            
+            # הפוזיציה הוחלפה (למשל בהיפוך כיוון) - תהליך מעקב אחר אחראי עליה כעת
+            if open_positions.get('monitor_data', {}).get(symbol) is not position_data:
+                log.info("מעקב על %s הוחלף, מפסיקים את המעקב הישן", symbol, extra={'symbol': symbol, 'stage': 'monitor'})
+                return
             
             # בדיקה אם הפוזיציה עדיין קיימת
             positions = client.futures_position_information(symbol=symbol)
@@ -209,23 +324,23 @@ def monitor_position_status(symbol):
                 # שליחת התראה
                 send_position_closed_notification(symbol, entry_price, exit_price, close_reason, is_long)
                 
+                # קישור התוצאה לאיתות שפתח את העסקה
+                if exit_price > 0:
+                    record_signal_outcome(symbol, position_data.get('signal_id'), calc_pnl_pct(entry_price, exit_price, is_long))
+                
                 # מחיקת נתוני המעקב מהזיכרון
-                if 'monitor_data' in open_positions and symbol in open_positions['monitor_data']:
+                if open_positions.get('monitor_data', {}).get(symbol) is position_data:
                     del open_positions['monitor_data'][symbol]
                     
                 break
                 
     except Exception as e:
-        print(f"שגיאה במעקב אחרי סטטוס פוזיציה {symbol}: {e}")
+        log.error("שגיאה במעקב אחרי סטטוס פוזיציה %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'monitor'})
 
 def send_position_closed_notification(symbol, entry_price, exit_price, close_reason, is_long):
     """שליחת התראה על סגירת פוזיציה"""
     
-    pnl_pct = 0
-    if is_long:
-        pnl_pct = ((exit_price / entry_price) - 1) * 100
-    else:
-        pnl_pct = ((entry_price / exit_price) - 1) * 100
+    pnl_pct = calc_pnl_pct(entry_price, exit_price, is_long)
         
     emoji = "🔴" if pnl_pct < 0 else "🟢"
     reason_emoji = "🎯" if "Take Profit" in close_reason else "🛑"
@@ -301,9 +416,162 @@ def generate_signal(df):
         'entry_price': round(entry_price, 2),
         'tp': round(tp, 2),
         'sl': round(sl, 2),
-        'valid_for_minutes': valid_for
+        'valid_for_minutes': valid_for,
+        # וקטור התנאים כ-bitmask לפי הסדר ב-CONDITION_NAMES
+        'long_mask': conditions_mask(long_conditions),
+        'short_mask': conditions_mask(short_conditions)
     }
 
+def conditions_mask(conditions):
+    """המרת רשימת תנאים בוליאניים ל-bitmask (ביט 0 = התנאי הראשון)"""
+    mask = 0
+    for i, condition in enumerate(conditions):
+        if condition:
+            mask |= 1 << i
+    return mask
+
+# === מאגר איכות איתותים ===
+# שמות התנאים לפי סדר הביטים ב-long_mask (ב-short_mask אותו סדר בכיוון ההפוך)
+CONDITION_NAMES = ('price_above_emas', 'supertrend', 'rsi', 'volume_spike', 'bullish_engulfing')
+SCORE_BUCKET_SIZE = 10
+
+class SignalStore:
+    """מאגר עמודתי של כל האיתותים שנבדקו, עם סיכומים מצטברים שמתעדכנים ב-O(1) לכל אירוע"""
+    SIGNAL_CODES = {'NO SIGNAL': 0, 'LONG': 1, 'SHORT': 2}
+    SIGNAL_NAMES = ('NO SIGNAL', 'LONG', 'SHORT')
+    DIMENSIONS = ('combo', 'symbol', 'score_bucket')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # עמודות - מערך רציף לכל שדה במקום מילון לכל איתות
+        self.timestamps = array('d')
+        self.symbol_ids = array('H')
+        self.signal_codes = array('b')
+        self.long_masks = array('B')
+        self.short_masks = array('B')
+        self.scores = array('d')
+        self.entry_prices = array('d')
+        self.tps = array('d')
+        self.sls = array('d')
+        self.outcomes = array('d')  # רווח/הפסד באחוזים, NaN עד שהעסקה נסגרת
+        self.symbol_table = []
+        self.symbol_ids_by_name = {}
+        self.rollups = {dimension: {} for dimension in self.DIMENSIONS}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _rollup_keys(self, symbol, signal, long_mask, short_mask, score):
+        mask = long_mask if signal == 'LONG' else short_mask
+        # ציון לא סופי (למשל RSI חסר כשאין מספיק נרות) נספר בטווח נפרד
+        if math.isfinite(score):
+            bucket = int(score // SCORE_BUCKET_SIZE) * SCORE_BUCKET_SIZE
+            score_bucket = f"{bucket}-{bucket + SCORE_BUCKET_SIZE - 1}"
+        else:
+            score_bucket = 'n/a'
+        return (
+            ('combo', f"{signal}:{format_conditions(mask)}"),
+            ('symbol', symbol),
+            ('score_bucket', score_bucket)
+        )
+
+    def _row_rollup_keys(self, row):
+        return self._rollup_keys(
+            self.symbol_table[self.symbol_ids[row]],
+            self.SIGNAL_NAMES[self.signal_codes[row]],
+            self.long_masks[row],
+            self.short_masks[row],
+            self.scores[row]
+        )
+
+    def record(self, symbol, signal_data):
+        """שמירת איתות שנבדק; מחזיר מזהה שורה לקישור לתוצאת העסקה"""
+        # כל ההמרות והמפתחות מחושבים לפני הכתיבה, כדי ששגיאה לא תשאיר שורה חלקית
+        signal = signal_data['signal']
+        signal_code = self.SIGNAL_CODES[signal]
+        long_mask = int(signal_data['long_mask'])
+        short_mask = int(signal_data['short_mask'])
+        score = float(signal_data['score'])
+        entry_price = float(signal_data['entry_price'])
+        tp = float(signal_data['tp'])
+        sl = float(signal_data['sl'])
+        keys = self._rollup_keys(symbol, signal, long_mask, short_mask, score)
+        with self.lock:
+            symbol_id = self.symbol_ids_by_name.get(symbol)
+            if symbol_id is None:
+                symbol_id = len(self.symbol_table)
+                self.symbol_table.append(symbol)
+                self.symbol_ids_by_name[symbol] = symbol_id
+            row = len(self.timestamps)
+            self.timestamps.append(time.time())
+            self.symbol_ids.append(symbol_id)
+            self.signal_codes.append(signal_code)
+            self.long_masks.append(long_mask)
+            self.short_masks.append(short_mask)
+            self.scores.append(score)
+            self.entry_prices.append(entry_price)
+            self.tps.append(tp)
+            self.sls.append(sl)
+            self.outcomes.append(math.nan)
+            for dimension, key in keys:
+                stats = self.rollups[dimension].setdefault(key, {'evaluated': 0, 'closed': 0, 'wins': 0, 'pnl_sum': 0.0})
+                stats['evaluated'] += 1
+            return row
+
+    def record_outcome(self, row, pnl_pct):
+        """קישור תוצאת העסקה שנסגרה לאיתות שפתח אותה ועדכון הסיכומים"""
+        if row is None or not math.isfinite(pnl_pct):
+            return False
+        with self.lock:
+            if not 0 <= row < len(self.outcomes) or not math.isnan(self.outcomes[row]):
+                return False
+            self.outcomes[row] = pnl_pct
+            for dimension, key in self._row_rollup_keys(row):
+                stats = self.rollups[dimension][key]
+                stats['closed'] += 1
+                stats['pnl_sum'] += pnl_pct
+                if pnl_pct > 0:
+                    stats['wins'] += 1
+            return True
+
+    def summary(self, dimension):
+        """סיכום לפי צירוף תנאים, מטבע או טווח ציון, כולל אחוז הצלחה וממוצע רווח"""
+        with self.lock:
+            rollup = {key: dict(stats) for key, stats in self.rollups[dimension].items()}
+        for stats in rollup.values():
+            closed = stats['closed']
+            stats['hit_rate'] = round(stats['wins'] / closed, 4) if closed else None
+            stats['avg_pnl_pct'] = round(stats['pnl_sum'] / closed, 4) if closed else None
+            stats['pnl_sum'] = round(stats['pnl_sum'], 4)
+        return rollup
+
+signal_store = SignalStore()
+
+def record_signal(symbol, signal_data):
+    """שמירת איתות במאגר בלי לעצור את המסחר אם השמירה נכשלת"""
+    try:
+        return signal_store.record(symbol, signal_data)
+    except Exception as e:
+        log.error("שגיאה בשמירת איתות עבור %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'signal_store'})
+        return None
+
+def record_signal_outcome(symbol, signal_id, pnl_pct):
+    """קישור תוצאת עסקה לאיתות בלי לעצור את המסחר אם הקישור נכשל"""
+    try:
+        signal_store.record_outcome(signal_id, pnl_pct)
+    except Exception as e:
+        log.error("שגיאה ברישום תוצאת איתות עבור %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'signal_store'})
+
+def format_conditions(mask):
+    """הצגת bitmask כמחרוזת 0/1 שבה התו ה-i הוא התנאי ה-i ב-CONDITION_NAMES"""
+    return ''.join('1' if mask >> i & 1 else '0' for i in range(len(CONDITION_NAMES)))
+
+def calc_pnl_pct(entry_price, exit_price, is_long):
+    """חישוב רווח/הפסד באחוזים לפי כיוון הפוזיציה"""
+    if is_long:
+        return ((exit_price / entry_price) - 1) * 100
+    return ((entry_price / exit_price) - 1) * 100
+
 # === לוגיקה של ניהול פוזיציות פתוחות לפי זמן ===
 def log_trade(symbol, direction, score, valid_until):
     """תיעוד עסקאות בזיכרון במקום בקובץ"""
@@ -320,9 +588,9 @@ def log_trade(symbol, direction, score, valid_until):
             'valid_until': valid_until.isoformat()
         }
         open_positions['trade_log'].append(log_entry)
-        print(f"נרשמה לוג עסקה: {log_entry}")
+        log.info("נרשמה לוג עסקה: %s", log_entry, extra={'symbol': symbol, 'stage': 'manage'})
     except Exception as e:
-        print(f"שגיאה ברישום לוג עסקה: {e}")
+        log.error("שגיאה ברישום לוג עסקה: %s", e, extra={'symbol': symbol, 'stage': 'manage'})
 
 def manage_open_positions(symbol, df, direction, score, valid_for_minutes):
     """ניהול פוזיציות פתוחות"""
@@ -339,11 +607,11 @@ def manage_open_positions(symbol, df, direction, score, valid_for_minutes):
         # המתנה עד 5 דקות לפני סיום התוקף
         wait_time = max(0, (valid_until - datetime.now() - timedelta(minutes=5)).total_seconds())
         if wait_time > 0:
-            time.sleep(wait_time)
+            tracked_sleep(wait_time, 'manage_valid_until')
             
         # בדיקה אם יש פוזיציה פתוחה בכלל
         if not is_position_open(symbol):
-            print(f"הפוזיציה עבור {symbol} כבר נסגרה, מפסיקים מעקב.")
+            log.info("הפוזיציה עבור %s כבר נסגרה, מפסיקים מעקב.", symbol, extra={'symbol': symbol, 'stage': 'manage'})
             if symbol in open_positions:
                 del open_positions[symbol]
             return
@@ -351,12 +619,13 @@ def manage_open_positions(symbol, df, direction, score, valid_for_minutes):
         updated_df = get_klines_df(symbol)
         updated_df = compute_indicators(updated_df)
         new_signal_data = generate_signal(updated_df)
+        new_signal_data['signal_id'] = record_signal(symbol, new_signal_data)
         new_direction = new_signal_data['signal']
         new_score = new_signal_data['score']
         new_valid_for = new_signal_data['valid_for_minutes']
         
         if new_direction == 'NO SIGNAL':
-            print(f"אין איתות חדש עבור {symbol}, ממשיכים לעקוב אחר הפוזיציה הקיימת.")
+            log.info("אין איתות חדש עבור %s, ממשיכים לעקוב אחר הפוזיציה הקיימת.", symbol, extra={'symbol': symbol, 'stage': 'manage'})
             return
             
         if new_direction != direction:
@@ -367,8 +636,9 @@ def manage_open_positions(symbol, df, direction, score, valid_for_minutes):
                 'score': new_score,
                 'valid_until': datetime.now() + timedelta(minutes=new_valid_for)
             }
-            # סגירת העסקה הקיימת
-            close_position(symbol)
+            # סגירת העסקה הקיימת ורישום התוצאה לאיתות שפתח אותה
+            exit_price = close_position(symbol)
+            record_reversed_outcome(symbol, exit_price)
             # פתיחת עסקה בכיוון החדש
             open_futures_trade(symbol, new_signal_data)
             manage_open_positions(symbol, updated_df, new_direction, new_score, new_valid_for)
@@ -380,10 +650,11 @@ def manage_open_positions(symbol, df, direction, score, valid_for_minutes):
             open_positions[symbol]['score'] = new_score
             manage_open_positions(symbol, updated_df, direction, new_score, new_valid_for)
     except Exception as e:
-        print(f"שגיאה בניהול פוזיציה עבור {symbol}: {e}")
+        log.error("שגיאה בניהול פוזיציה עבור %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'manage'})
 
 def close_position(symbol):
-    """סגירת פוזיציה קיימת"""
+    """סגירת פוזיציה קיימת; מחזיר את מחיר המילוי הממוצע של פקודת הסגירה (או None)"""
+    exit_price = None
     try:
         positions = client.futures_position_information(symbol=symbol)
         for pos in positions:
@@ -394,19 +665,34 @@ def close_position(symbol):
             side = SIDE_SELL if pos_amt > 0 else SIDE_BUY
             qty = abs(pos_amt)
             
-            print(f"סוגר פוזיציה {symbol}: {side} {qty}")
-            client.futures_create_order(
+            log.info("סוגר פוזיציה %s: %s %s", symbol, side, qty, extra={'symbol': symbol, 'stage': 'close'})
+            start = time.perf_counter()
+            close_order = client.futures_create_order(
                 symbol=symbol,
                 side=side,
                 type=ORDER_TYPE_MARKET,
                 quantity=qty,
-                reduceOnly=True
+                reduceOnly=True,
+                newOrderRespType='RESULT'  # כדי לקבל avgPrice של המילוי בתשובה
             )
-            print(f"פוזיציה נסגרה: {symbol}")
+            exit_price = float(close_order.get('avgPrice') or 0) or None
+            log.info("פוזיציה נסגרה: %s", symbol, extra={
+                'symbol': symbol, 'stage': 'close', 'order_id': close_order.get('orderId'),
+                'latency_ms': round((time.perf_counter() - start) * 1000, 1)
+            })
             # ביטול הזמנות פתוחות (TP/SL)
             client.futures_cancel_all_open_orders(symbol=symbol)
     except Exception as e:
-        print(f"שגיאה בסגירת פוזיציה {symbol}: {e}")
+        log.error("שגיאה בסגירת פוזיציה %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'close'})
+    return exit_price
+
+def record_reversed_outcome(symbol, exit_price):
+    """רישום תוצאת הפוזיציה שנסגרה בהיפוך כיוון והסרת נתוני המעקב שלה (תהליך המעקב הישן ייעצר)"""
+    position_data = open_positions.get('monitor_data', {}).pop(symbol, None)
+    if not position_data or not exit_price:
+        return
+    pnl_pct = calc_pnl_pct(position_data['entry_price'], exit_price, position_data['is_long'])
+    record_signal_outcome(symbol, position_data.get('signal_id'), pnl_pct)
 
 # === פונקציות למסחר בפועל ===
 def is_position_open(symbol):
@@ -418,7 +704,7 @@ def is_position_open(symbol):
                 return True
         return False
     except Exception as e:
-        print(f"שגיאה בבדיקת סטטוס פוזיציה: {e}")
+        log.error("שגיאה בבדיקת סטטוס פוזיציה: %s", e, extra={'symbol': symbol, 'stage': 'position'})
         return False
 
 def get_position_settings(score):
@@ -437,8 +723,9 @@ def setup_tp_sl(symbol, quantity, opposite_side, tp, sl, precision):
     for attempt in range(3):  # 3 ניסיונות
         try:
             tp_price = round(tp, precision)
-            print(f"מגדיר TP ל-{symbol}: {tp_price} (ניסיון {attempt+1})")
+            log.info("מגדיר TP ל-%s: %s (ניסיון %d)", symbol, tp_price, attempt + 1, extra={'symbol': symbol, 'stage': 'tp_sl'})
             
+            start = time.perf_counter()
             tp_order = client.futures_create_order(
                 symbol=symbol, 
                 side=opposite_side, 
@@ -448,11 +735,14 @@ def setup_tp_sl(symbol, quantity, opposite_side, tp, sl, precision):
                 price=tp_price,
                 reduceOnly=True
             )
-            print(f"הגדרת TP הצליחה: {tp_order}")
+            log.info("הגדרת TP הצליחה: %s", symbol, extra={
+                'symbol': symbol, 'stage': 'tp_sl', 'order_id': tp_order.get('orderId'),
+                'latency_ms': round((time.perf_counter() - start) * 1000, 1)
+            })
             break  # יציאה מהלולאה אם הצליח
             
         except Exception as e:
-            print(f"שגיאה בהגדרת TP (ניסיון {attempt+1}): {e}")
+            log.warning("שגיאה בהגדרת TP (ניסיון %d): %s", attempt + 1, e, extra={'symbol': symbol, 'stage': 'tp_sl'})
             if attempt < 2:  # אם זה לא הניסיון האחרון
                 time.sleep(2)  # המתנה לפני ניסיון נוסף
     
@@ -460,8 +750,9 @@ def setup_tp_sl(symbol, quantity, opposite_side, tp, sl, precision):
     for attempt in range(3):  # 3 ניסיונות
         try:
             sl_price = round(sl, precision)
-            print(f"מגדיר SL ל-{symbol}: {sl_price} (ניסיון {attempt+1})")
+            log.info("מגדיר SL ל-%s: %s (ניסיון %d)", symbol, sl_price, attempt + 1, extra={'symbol': symbol, 'stage': 'tp_sl'})
             
+            start = time.perf_counter()
             sl_order = client.futures_create_order(
                 symbol=symbol, 
                 side=opposite_side, 
@@ -471,96 +762,144 @@ def setup_tp_sl(symbol, quantity, opposite_side, tp, sl, precision):
                 quantity=quantity, 
                 reduceOnly=True
             )
-            print(f"הגדרת SL הצליחה: {sl_order}")
+            log.info("הגדרת SL הצליחה: %s", symbol, extra={
+                'symbol': symbol, 'stage': 'tp_sl', 'order_id': sl_order.get('orderId'),
+                'latency_ms': round((time.perf_counter() - start) * 1000, 1)
+            })
             break  # יציאה מהלולאה אם הצליח
             
         except Exception as e:
-            print(f"שגיאה בהגדרת SL (ניסיון {attempt+1}): {e}")
+            log.warning("שגיאה בהגדרת SL (ניסיון %d): %s", attempt + 1, e, extra={'symbol': symbol, 'stage': 'tp_sl'})
             if attempt < 2:  # אם זה לא הניסיון האחרון
                 time.sleep(2)  # המתנה לפני ניסיון נוסף
 
-def verify_tp_sl_orders(symbol):
-    """פונקציה לבדיקה שאכן נוצרו הזמנות TP/SL"""
-    try:
-        orders = client.futures_get_open_orders(symbol=symbol)
-        
-        has_tp = False
-        has_sl = False
-        
-        for order in orders:
-            if order['type'] == 'LIMIT' and order['reduceOnly']:
-                has_tp = True
-            elif order['type'] == 'STOP_MARKET' and order['reduceOnly']:
-                has_sl = True
-        
-        if not has_tp or not has_sl:
-            print(f"⚠️ חסרות הזמנות TP/SL ל-{symbol}. TP: {has_tp}, SL: {has_sl}")
+def build_tp_sl_repair_orders(symbol, position, missing_tp, missing_sl):
+    """בניית הזמנות TP/SL חסרות לפוזיציה פתוחה (לשליחה כ-batch)"""
+    # חישוב מחדש של מחירי TP/SL
+    entry_price = float(position['entryPrice'])
+    pos_amt = float(position['positionAmt'])
+    is_long = pos_amt > 0
+    
+    # חישוב בסיסי של TP/SL
+    tp_pct = 0.015  # רווח של 1.5%
+    sl_pct = 0.01   # הפסד של 1%
+    
+    if is_long:
+        tp = entry_price * (1 + tp_pct)
+        sl = entry_price * (1 - sl_pct)
+        side = SIDE_SELL
+    else:
+        tp = entry_price * (1 - tp_pct)
+        sl = entry_price * (1 + sl_pct)
+        side = SIDE_BUY
+    
+    quantity = abs(pos_amt)
+    precision = get_precision(symbol)
+    
+    # ה-API של batchOrders מצפה לערכים כמחרוזות
+    repair_orders = []
+    if missing_tp:
+        tp_price = round(tp, precision)
+        log.info("יוצר TP חסר ל-%s: %s", symbol, tp_price, extra={'symbol': symbol, 'stage': 'reconcile'})
+        repair_orders.append({
+            'symbol': symbol,
+            'side': side,
+            'type': ORDER_TYPE_LIMIT,
+            'timeInForce': TIME_IN_FORCE_GTC,
+            'quantity': str(quantity),
+            'price': str(tp_price),
+            'reduceOnly': 'true'
+        })
+    
+    if missing_sl:
+        sl_price = round(sl, precision)
+        log.info("יוצר SL חסר ל-%s: %s", symbol, sl_price, extra={'symbol': symbol, 'stage': 'reconcile'})
+        repair_orders.append({
+            'symbol': symbol,
+            'side': side,
+            'type': ORDER_TYPE_STOP_MARKET,
+            'timeInForce': TIME_IN_FORCE_GTC,
+            'stopPrice': str(sl_price),
+            'quantity': str(quantity),
+            'reduceOnly': 'true'
+        })
+    
+    return repair_orders
+
+def reconcile_tp_sl():
+    """סבב בדיקה מרוכז: שליפת כל ההזמנות וכל הפוזיציות בקריאה אחת כל אחת ותיקון TP/SL חסרים"""
+    with reconcile_lock:
+        start = time.perf_counter()
+        open_pos = {}
+        repairs = 0
+        try:
+            # צילום המטבעות שבהגדרה לפני שליפת ההזמנות - מטבע שסיים הגדרה באמצע הסבב
+            # עלול להופיע בצילום ההזמנות הישן בלי TP/SL ולקבל הזמנה כפולה
+            in_progress_at_start = set(tp_sl_in_progress)
+            orders = client.futures_get_open_orders()
+            positions = client.futures_position_information()
             
-            # קבלת מידע על הפוזיציה הפתוחה
-            position = None
-            positions = client.futures_position_information(symbol=symbol)
+            tracked = set(symbols)
             for pos in positions:
-                if float(pos['positionAmt']) != 0:
-                    position = pos
-                    break
+                if pos['symbol'] in tracked and float(pos['positionAmt']) != 0:
+                    open_pos.setdefault(pos['symbol'], pos)
+            
+            has_tp = {o['symbol'] for o in orders if o['type'] == 'LIMIT' and o.get('reduceOnly')}
+            has_sl = {o['symbol'] for o in orders if o['type'] == 'STOP_MARKET' and o.get('reduceOnly')}
+            
+            # פוזיציות שהיו בהגדרת TP/SL בכל שלב של הסבב לא נבדקות בו
+            candidates = set(open_pos) - (in_progress_at_start | tp_sl_in_progress)
+            missing_tp = candidates - has_tp
+            missing_sl = candidates - has_sl
+            
+            repair_orders = []
+            for symbol in sorted(missing_tp | missing_sl):
+                log.warning("⚠️ חסרות הזמנות TP/SL ל-%s. TP: %s, SL: %s", symbol, symbol not in missing_tp,
+                            symbol not in missing_sl, extra={'symbol': symbol, 'stage': 'reconcile'})
+                try:
+                    repair_orders.extend(build_tp_sl_repair_orders(
+                        symbol, open_pos[symbol], symbol in missing_tp, symbol in missing_sl
+                    ))
+                except Exception as e:
+                    log.error("שגיאה בהכנת TP/SL חסר ל-%s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'reconcile'})
+            
+            # שליחת ההזמנות החסרות במנות של עד 5 (מגבלת batchOrders של Binance)
+            for i in range(0, len(repair_orders), 5):
+                batch = repair_orders[i:i + 5]
+                try:
+                    results = client.futures_place_batch_order(batchOrders=batch)
+                    for order, result in zip(batch, results):
+                        if 'orderId' in result:
+                            repairs += 1
+                            log.info("נוצר %s חסר ל-%s", order['type'], order['symbol'], extra={
+                                'symbol': order['symbol'], 'stage': 'reconcile', 'order_id': result['orderId']
+                            })
+                        else:
+                            log.error("שגיאה ביצירת %s חסר ל-%s: %s", order['type'], order['symbol'], result,
+                                      extra={'symbol': order['symbol'], 'stage': 'reconcile'})
+                except Exception as e:
+                    log.error("שגיאה בשליחת הזמנות TP/SL חסרות: %s", e, extra={'stage': 'reconcile'})
                     
-            if position:
-                # חישוב מחדש של מחירי TP/SL
-                entry_price = float(position['entryPrice'])
-                pos_amt = float(position['positionAmt'])
-                is_long = pos_amt > 0
-                
-                # חישוב בסיסי של TP/SL
-                tp_pct = 0.015  # רווח של 1.5%
-                sl_pct = 0.01   # הפסד של 1%
-                
-                if is_long:
-                    tp = entry_price * (1 + tp_pct)
-                    sl = entry_price * (1 - sl_pct)
-                    side = SIDE_SELL
-                else:
-                    tp = entry_price * (1 - tp_pct)
-                    sl = entry_price * (1 + sl_pct)
-                    side = SIDE_BUY
-                
-                quantity = abs(pos_amt)
-                precision = get_precision(symbol)
-                
-                # יצירת הזמנות חסרות
-                if not has_tp:
-                    try:
-                        tp_price = round(tp, precision)
-                        print(f"יוצר TP חסר ל-{symbol}: {tp_price}")
-                        client.futures_create_order(
-                            symbol=symbol, 
-                            side=side, 
-                            type=ORDER_TYPE_LIMIT,
-                            timeInForce=TIME_IN_FORCE_GTC,
-                            quantity=quantity, 
-                            price=tp_price,
-                            reduceOnly=True
-                        )
-                    except Exception as e:
-                        print(f"שגיאה ביצירת TP חסר: {e}")
-                
-                if not has_sl:
-                    try:
-                        sl_price = round(sl, precision)
-                        print(f"יוצר SL חסר ל-{symbol}: {sl_price}")
-                        client.futures_create_order(
-                            symbol=symbol, 
-                            side=side, 
-                            type=ORDER_TYPE_STOP_MARKET,
-                            timeInForce=TIME_IN_FORCE_GTC,
-                            stopPrice=sl_price,
-                            quantity=quantity, 
-                            reduceOnly=True
-                        )
-                    except Exception as e:
-                        print(f"שגיאה ביצירת SL חסר: {e}")
+        except Exception as e:
+            log.error("שגיאה בבדיקת הזמנות TP/SL: %s", e, extra={'stage': 'reconcile'})
         
-    except Exception as e:
-        print(f"שגיאה בבדיקת הזמנות TP/SL: {e}")
+        duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        reconcile_stats['runs'] += 1
+        reconcile_stats['last_duration_ms'] = duration_ms
+        reconcile_stats['last_repairs'] = repairs
+        reconcile_stats['total_repairs'] += repairs
+        log.info("🔧 סבב TP/SL: %d פוזיציות פתוחות, %d תיקונים, %sms", len(open_pos), repairs, duration_ms,
+                 extra={'stage': 'reconcile', 'latency_ms': duration_ms})
+        return {'positions': len(open_pos), 'repairs': repairs, 'duration_ms': duration_ms}
+
+def run_tp_sl_reconciler():
+    """לולאת רקע שמריצה סבב בדיקת TP/SL כל RECONCILE_INTERVAL_SEC שניות"""
+    while True:
+        tracked_sleep(RECONCILE_INTERVAL_SEC, 'reconcile_interval')
+        try:
+            reconcile_tp_sl()
+        except Exception as e:
+            log.error("שגיאה בלולאת בדיקת TP/SL: %s", e, extra={'stage': 'reconcile'})
 
 def open_futures_trade(symbol, signal_data):
     """פתיחת עסקת פיוצ'רס"""
@@ -578,25 +917,25 @@ def open_futures_trade(symbol, signal_data):
         # בדיקה שערך העסקה מספיק גבוה
         min_trade_value = 25  # מינימום 25 דולר לעסקה
         if amount_usd < min_trade_value:
-            print(f"❌ שווי עסקה קטן מ-{min_trade_value}$ ב-{symbol} – נמנעים מפתיחה.")
+            log.warning("❌ שווי עסקה קטן מ-%s$ ב-%s – נמנעים מפתיחה.", min_trade_value, symbol, extra={'symbol': symbol, 'stage': 'open'})
             return
         
         # הגדרת מינוף ומרג'ין
         try:
             client.futures_change_leverage(symbol=symbol, leverage=leverage)
-            print(f"מינוף עודכן: {symbol} - {leverage}x")
+            log.info("מינוף עודכן: %s - %sx", symbol, leverage, extra={'symbol': symbol, 'stage': 'open'})
         except Exception as e:
             # התעלמות משגיאת מינוף כפול
             if "No need to change leverage" not in str(e):
-                print(f"שגיאה בהגדרת מינוף: {e}")
+                log.error("שגיאה בהגדרת מינוף: %s", e, extra={'symbol': symbol, 'stage': 'open'})
         
         try:
             client.futures_change_margin_type(symbol=symbol, marginType='ISOLATED')
-            print(f"סוג מרג'ין עודכן: {symbol} - ISOLATED")
+            log.info("סוג מרג'ין עודכן: %s - ISOLATED", symbol, extra={'symbol': symbol, 'stage': 'open'})
         except Exception as e:
             # התעלמות משגיאת שינוי מרג'ין מיותר
             if "No need to change margin type" not in str(e):
-                print(f"שגיאה בהגדרת סוג מרג'ין: {e}")
+                log.error("שגיאה בהגדרת סוג מרג'ין: %s", e, extra={'symbol': symbol, 'stage': 'open'})
 
         # קבלת מחיר עדכני והכמות לקנייה
         try:
@@ -605,43 +944,57 @@ def open_futures_trade(symbol, signal_data):
             quantity = round(amount_usd * leverage / mark_price, precision)
             
             if quantity <= 0:
-                print(f"❌ כמות לא חוקית ל-{symbol} (quantity={quantity}) – נמנעים מפתיחה.")
+                log.warning("❌ כמות לא חוקית ל-%s (quantity=%s) – נמנעים מפתיחה.", symbol, quantity, extra={'symbol': symbol, 'stage': 'open'})
                 return
                 
-            print(f"פותח עסקה {side} עבור {symbol}, כמות: {quantity}, מינוף: {leverage}x")
+            log.info("פותח עסקה %s עבור %s, כמות: %s, מינוף: %sx", side, symbol, quantity, leverage, extra={'symbol': symbol, 'stage': 'open'})
             
-            # פתיחת הפוזיציה
-            order = client.futures_create_order(
-                symbol=symbol, 
-                side=side, 
-                type=ORDER_TYPE_MARKET, 
-                quantity=quantity
-            )
+            # סבב בדיקת TP/SL מדלג על המטבע עד שסיימנו להגדיר לו TP/SL בעצמנו
+            tp_sl_in_progress.add(symbol)
+            try:
+                # פתיחת הפוזיציה
+                start = time.perf_counter()
+                order = client.futures_create_order(
+                    symbol=symbol, 
+                    side=side, 
+                    type=ORDER_TYPE_MARKET, 
+                    quantity=quantity
+                )
             
-            print(f"פתיחת עסקה בוצעה: {order}")
+                log.info("פתיחת עסקה בוצעה: %s", symbol, extra={
+                    'symbol': symbol, 'stage': 'open', 'order_id': order.get('orderId'),
+                    'latency_ms': round((time.perf_counter() - start) * 1000, 1)
+                })
+                
+                # קישור הפוזיציה לאיתות שפתח אותה (נקרא ע"י setup_order_status_monitor)
+                if 'signal_links' not in open_positions:
+                    open_positions['signal_links'] = {}
+                open_positions['signal_links'][symbol] = signal_data.get('signal_id')
             
-            # שליחת התראה מפורטת לטלגרם
-            send_trade_open_notification(symbol, signal_data, quantity, leverage, mark_price)
+                # שליחת התראה מפורטת לטלגרם
+                send_trade_open_notification(symbol, signal_data, quantity, leverage, mark_price)
             
-            # המתנה קצרה לוודא שהעסקה התבצעה
-            time.sleep(2)
+                # המתנה קצרה לוודא שהעסקה התבצעה
+                time.sleep(2)
             
-            # הגדרת TP/SL
-            setup_tp_sl(symbol, quantity, opposite_side, tp, sl, precision)
+                # הגדרת TP/SL
+                setup_tp_sl(symbol, quantity, opposite_side, tp, sl, precision)
+            finally:
+                tp_sl_in_progress.discard(symbol)
             
-            # בדיקה שאכן נוצרו הזמנות TP/SL
+            # בדיקה שאכן נוצרו הזמנות TP/SL (סבב מרוכז לכל הפוזיציות)
             time.sleep(2)
-            verify_tp_sl_orders(symbol)
+            reconcile_tp_sl()
             
             # הפעלת מנגנון מעקב עבור סטטוס העסקה
             time.sleep(1)  # המתנה להשלמת העסקה והזמנות
             setup_order_status_monitor(symbol)
             
         except Exception as e:
-            print(f"שגיאה בפתיחת עסקה: {e}")
+            log.error("שגיאה בפתיחת עסקה: %s", e, extra={'symbol': symbol, 'stage': 'open'})
             
     except Exception as e:
-        print(f"שגיאה כללית בעסקה: {e}")
+        log.error("שגיאה כללית בעסקה: %s", e, extra={'symbol': symbol, 'stage': 'open'})
 
 # === שליפת נתוני מסחר מ-Binance ===
 def get_klines_df(symbol, interval='15m', limit=100):
@@ -656,27 +1009,29 @@ def get_klines_df(symbol, interval='15m', limit=100):
         df = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
         return df
     except Exception as e:
-        print(f"שגיאה בשליפת נתוני מסחר עבור {symbol}: {e}")
+        log.error("שגיאה בשליפת נתוני מסחר עבור %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'klines'})
         raise
 
 # === עיבוד עבור מטבע בודד ===
 def process_symbol(symbol, df):
     """עיבוד וקבלת החלטות עבור מטבע בודד"""
     try:
-        print(f"🔍 בודק את {symbol} בעומק עם אינדיקטור TOM...")
+        log.debug("🔍 בודק את %s בעומק עם אינדיקטור TOM...", symbol, extra={'symbol': symbol, 'stage': 'scan'})
         df = compute_indicators(df)
         signal_data = generate_signal(df)
-        print(f"🔁 {symbol} | איתות: {signal_data['signal']} | חוזק: {signal_data['score']}")
+        signal_data['signal_id'] = record_signal(symbol, signal_data)
+        log.info("🔁 %s | איתות: %s | חוזק: %s", symbol, signal_data['signal'], signal_data['score'],
+                 extra={'symbol': symbol, 'stage': 'signal'})
         
         if signal_data['signal'] == 'NO SIGNAL':
-            print(f"אין איתות עבור {symbol}, ממשיכים.")
+            log.info("אין איתות עבור %s, ממשיכים.", symbol, extra={'symbol': symbol, 'stage': 'scan'})
             return
             
         msg = f"📡 איתות על {symbol} | כיוון: {signal_data['signal']} | חוזק: {signal_data['score']}"
         send_telegram_message(msg)
         
         if is_position_open(symbol):
-            print(f"⚠️ כבר יש פוזיציה פתוחה עבור {symbol}, לא פותחים עסקה חדשה.")
+            log.info("⚠️ כבר יש פוזיציה פתוחה עבור %s, לא פותחים עסקה חדשה.", symbol, extra={'symbol': symbol, 'stage': 'signal'})
             return
             
         # פתיחת עסקה חדשה
@@ -685,55 +1040,305 @@ def process_symbol(symbol, df):
         # תהליך נפרד לניהול הפוזיציה לאורך זמן
         manage_thread = threading.Thread(
             target=manage_open_positions, 
-            args=(symbol, df, signal_data['signal'], signal_data['score'], signal_data['valid_for_minutes'])
+            args=(symbol, df, signal_data['signal'], signal_data['score'], signal_data['valid_for_minutes']),
+            name=f"manage-{symbol}"
         )
         manage_thread.daemon = True  # מאפשר לתכנית הראשית להסתיים גם אם התהליך עדיין רץ
         manage_thread.start()
         
     except Exception as e:
-        print(f"שגיאה בעיבוד {symbol}: {e}")
+        log.error("שגיאה בעיבוד %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'scan'})
+
+# === פרופיילר ודיאגנוסטיקה של תהליכים ===
+# מצב שינה של כל תהליך (לפי ident): סיבה וזמן סיום משוער
+thread_sleep_state = {}
+
+def tracked_sleep(seconds, reason):
+    """השהייה שנרשמת במצב התהליכים כדי שיהיה אפשר לראות מי ישן, למה ועד מתי"""
+    ident = threading.get_ident()
+    thread_sleep_state[ident] = {'reason': reason, 'until': time.time() + seconds}
+    try:
+        time.sleep(seconds)
+    finally:
+        thread_sleep_state.pop(ident, None)
+
+def deep_sizeof(obj, seen=None):
+    """הערכת הזיכרון שתופס אובייקט כולל כל מה שהוא מכיל"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    # העתקה לרשימה כדי לא להיכשל אם תהליך אחר משנה את המבנה תוך כדי
+    if isinstance(obj, dict):
+        for key, value in list(obj.items()):
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in list(obj):
+            size += deep_sizeof(item, seen)
+    return size
+
+def get_thread_inventory():
+    """תמונת מצב של כל התהליכים, מקובצים לפי מטבע, כולל מצב שינה וזיכרון של open_positions"""
+    frames = sys._current_frames()
+    now = time.time()
+    threads = []
+    per_symbol = {}
+    for thread in threading.enumerate():
+        # שמות התהליכים בפורמט <תפקיד>-<מטבע>, למשל manage-BTCUSDT
+        role, _, symbol = thread.name.partition('-')
+        symbol = symbol if symbol in symbols else None
+        frame = frames.get(thread.ident)
+        # עומק הקריאות הרקורסיביות של manage_open_positions בתהליך
+        depth = 0
+        top = None
+        if frame is not None:
+            top = f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+            f = frame
+            while f is not None:
+                if f.f_code.co_name == 'manage_open_positions':
+                    depth += 1
+                f = f.f_back
+        sleep = thread_sleep_state.get(thread.ident)
+        info = {
+            'name': thread.name,
+            'ident': thread.ident,
+            'daemon': thread.daemon,
+            'symbol': symbol,
+            'sleeping': sleep is not None,
+            'sleep_reason': sleep['reason'] if sleep else None,
+            'sleep_remaining_sec': round(max(0, sleep['until'] - now), 1) if sleep else None,
+            'manage_depth': depth,
+            'top_frame': top
+        }
+        threads.append(info)
+        if symbol:
+            counts = per_symbol.setdefault(symbol, {})
+            counts[role] = counts.get(role, 0) + 1
+    return {
+        'thread_count': len(threads),
+        'per_symbol': per_symbol,
+        'threads': threads,
+        'open_positions_bytes': deep_sizeof(open_positions),
+        'trade_log_entries': len(open_positions.get('trade_log', [])),
+        'reconcile': dict(reconcile_stats),
+        'signal_store_rows': len(signal_store),
+        'log_dropped': sum(getattr(h, 'dropped', 0) for h in log.handlers),
+        'profiler_running': profiler.running,
+        'profiler_samples': profiler.samples
+    }
+
+# פרמטרים של הפרופיילר: מרווח דגימה ומשך מקסימלי להרצה אחת
+PROFILER_INTERVAL_SEC = float(os.getenv("PROFILER_INTERVAL_SEC", "0.01"))
+PROFILER_MAX_SEC = float(os.getenv("PROFILER_MAX_SEC", "300"))
+# מרווח מינימלי - מרווח קטן יותר הופך את הדגימה ללולאה עמוסה שמחזיקה את ה-GIL
+PROFILER_MIN_INTERVAL_SEC = 0.001
+
+class SamplingProfiler:
+    """פרופיילר דוגם: צובר מחסניות של כל התהליכים בפורמט collapsed שמתאים ל-flamegraph"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks = {}
+        self.samples = 0
+        self.stop_event = None
+
+    @property
+    def running(self):
+        return self.stop_event is not None and not self.stop_event.is_set()
+
+    def start(self, interval=PROFILER_INTERVAL_SEC, max_seconds=PROFILER_MAX_SEC):
+        """הפעלת דגימה בתהליך רקע; כשהפרופיילר כבוי אין שום עלות"""
+        if not math.isfinite(interval) or not math.isfinite(max_seconds):
+            raise ValueError("interval and max_seconds must be finite")
+        interval = max(interval, PROFILER_MIN_INTERVAL_SEC)
+        with self.lock:
+            if self.running:
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.stop_event = threading.Event()
+            sampler_thread = threading.Thread(
+                target=self._run,
+                args=(self.stop_event, interval, max_seconds),
+                name="profiler"
+            )
+            sampler_thread.daemon = True
+            sampler_thread.start()
+        log.info("פרופיילר הופעל (מרווח %ss)", interval, extra={'stage': 'profiler'})
+        return True
+
+    def stop(self):
+        """עצירת הדגימה; התוצאות נשמרות עד ההפעלה הבאה"""
+        with self.lock:
+            if not self.running:
+                return False
+            self.stop_event.set()
+        log.info("פרופיילר נעצר אחרי %d דגימות", self.samples, extra={'stage': 'profiler'})
+        return True
+
+    def toggle(self):
+        """החלפת מצב הפרופיילר (לשימוש מ-signal)"""
+        if not self.stop():
+            self.start()
+
+    def _run(self, stop_event, interval, max_seconds):
+        own_ident = threading.get_ident()
+        deadline = time.time() + max_seconds
+        while not stop_event.is_set():
+            if time.time() >= deadline:
+                stop_event.set()
+                log.info("פרופיילר נעצר אוטומטית אחרי %d דגימות", self.samples, extra={'stage': 'profiler'})
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+            stop_event.wait(interval)
+
+    def collapsed(self):
+        """הפקת הפלט בפורמט collapsed: שורה לכל מחסנית עם מספר הדגימות"""
+        stacks = dict(self.stacks)
+        return '\n'.join(f"{stack} {count}" for stack, count in sorted(stacks.items(), key=lambda x: -x[1]))
+
+profiler = SamplingProfiler()
+
+# === שרת HTTP לדיאגנוסטיקה ===
+# השרת עולה רק אם הוגדר DEBUG_TOKEN, וכל בקשה חייבת לכלול את הטוקן
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+DEBUG_PORT = int(os.getenv("PORT", "10000"))
+
+class DebugRequestHandler(BaseHTTPRequestHandler):
+    """נקודות קצה: /debug/threads, /debug/signals, /debug/profile, /debug/profile/start, /debug/profile/stop"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        # הטוקן מתקבל רק בכותרת, כדי שלא יופיע ב-URL ובלוגים
+        token = self.headers.get('X-Debug-Token', '')
+        if not hmac.compare_digest(token.encode('utf-8'), DEBUG_TOKEN.encode('utf-8')):
+            self._respond(403, 'forbidden')
+            return
+
+        if url.path == '/debug/threads':
+            self._respond(200, json.dumps(get_thread_inventory(), ensure_ascii=False, default=str), 'application/json')
+        elif url.path == '/debug/signals':
+            dimension = params.get('by', ['combo'])[0]
+            if dimension not in SignalStore.DIMENSIONS:
+                self._respond(400, f"by must be one of {', '.join(SignalStore.DIMENSIONS)}")
+                return
+            self._respond(200, json.dumps(signal_store.summary(dimension), ensure_ascii=False), 'application/json')
+        elif url.path == '/debug/profile/start':
+            try:
+                interval = float(params.get('interval', [PROFILER_INTERVAL_SEC])[0])
+            except ValueError:
+                interval = math.nan
+            if not math.isfinite(interval) or interval < PROFILER_MIN_INTERVAL_SEC:
+                self._respond(400, f"interval must be a finite number >= {PROFILER_MIN_INTERVAL_SEC}")
+                return
+            started = profiler.start(interval=interval)
+            self._respond(200, 'started' if started else 'already running')
+        elif url.path == '/debug/profile/stop':
+            stopped = profiler.stop()
+            self._respond(200, 'stopped' if stopped else 'not running')
+        elif url.path == '/debug/profile':
+            self._respond(200, profiler.collapsed())
+        else:
+            self._respond(404, 'not found')
+
+    do_POST = do_GET
+
+    def _respond(self, status, body, content_type='text/plain'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # רישום הנתיב בלבד, בלי query string
+        log.debug("debug http: %s %s", self.command, urlparse(self.path).path, extra={'stage': 'debug_http'})
+
+def start_debug_server():
+    """הפעלת שרת הדיאגנוסטיקה בתהליך רקע ורישום SIGUSR1 להפעלה/עצירה של הפרופיילר"""
+    if hasattr(signal, 'SIGUSR1'):
+        # ההחלפה רצה בתהליך נפרד כדי לא לתפוס נעילות של הלוגר מתוך ה-signal handler
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=profiler.toggle, name="profiler-toggle", daemon=True
+        ).start())
+
+    if not DEBUG_TOKEN:
+        return
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', DEBUG_PORT), DebugRequestHandler)
+        server.daemon_threads = True
+        server_thread = threading.Thread(target=server.serve_forever, name="debug-http")
+        server_thread.daemon = True
+        server_thread.start()
+        log.info("שרת דיאגנוסטיקה מאזין בפורט %d", DEBUG_PORT, extra={'stage': 'debug_http'})
+    except Exception as e:
+        log.error("שגיאה בהפעלת שרת דיאגנוסטיקה: %s", e, extra={'stage': 'debug_http'})
 
 # === לולאה: סריקה כל 5 דקות ===
 def run_bot():
     """הפעלת הבוט בלולאה"""
-    print("🚀 מתחיל הרצת בוט מסחר TOM_AI...")
-    print(f"מטבעות במעקב: {', '.join(symbols)}")
+    log.info("🚀 מתחיל הרצת בוט מסחר TOM_AI...", extra={'stage': 'startup'})
+    log.info("מטבעות במעקב: %s", ', '.join(symbols), extra={'stage': 'startup'})
     send_telegram_message(f"🤖 בוט TOM_AI הופעל!\nפורטפוליו: {PORTFOLIO_USD} USDT\nמטבעות במעקב: {', '.join(symbols)}")
     
+    # נקודות קצה לדיאגנוסטיקה ופרופיילר (SIGUSR1 מפעיל/עוצר את הפרופיילר)
+    start_debug_server()
+    
     # בדיקת TP/SL חסרים בפוזיציות קיימות
+    reconcile_tp_sl()
     for symbol in symbols:
         if is_position_open(symbol):
-            verify_tp_sl_orders(symbol)
             setup_order_status_monitor(symbol)
     
+    # סבב תקופתי לתיקון TP/SL שנעלמו גם אחרי ההפעלה
+    reconcile_thread = threading.Thread(target=run_tp_sl_reconciler, name="reconcile")
+    reconcile_thread.daemon = True
+    reconcile_thread.start()
+    
     while True:
         try:
             current_time = datetime.now().strftime('%H:%M:%S')
-            print(f"⏱️ סריקה {current_time}")
+            log.info("⏱️ סריקה %s", current_time, extra={'stage': 'scan'})
             
             for symbol in symbols:
                 try:
-                    print(f"בודק {symbol}...")
+                    log.debug("בודק %s...", symbol, extra={'symbol': symbol, 'stage': 'scan'})
                     df = get_klines_df(symbol)
                     process_symbol(symbol, df)
                     # השהייה קצרה בין מטבעות למניעת עומס על API
                     time.sleep(1)
                 except Exception as e:
-                    print(f"שגיאה בסימבול {symbol}: {e}")
+                    log.error("שגיאה בסימבול %s: %s", symbol, e, extra={'symbol': symbol, 'stage': 'scan'})
                     continue
                     
             wait_time = 300  # 5 דקות
-            print(f"💤 ממתין {wait_time} שניות עד הסריקה הבאה...")
-            time.sleep(wait_time)
+            log.info("💤 ממתין %s שניות עד הסריקה הבאה...", wait_time, extra={'stage': 'scan'})
+            tracked_sleep(wait_time, 'scan_interval')
             
         except KeyboardInterrupt:
-            print("🛑 עצירת הבוט על ידי המשתמש.")
+            log.info("🛑 עצירת הבוט על ידי המשתמש.", extra={'stage': 'shutdown'})
             send_telegram_message("🛑 בוט TOM_AI הופסק ידנית.")
             break
             
         except Exception as e:
-            print(f"שגיאה כללית בהרצת הבוט: {e}")
-            time.sleep(60)  # המתנה קצרה במקרה של שגיאה לפני ניסיון נוסף
+            log.error("שגיאה כללית בהרצת הבוט: %s", e, extra={'stage': 'scan'})
+            tracked_sleep(60, 'scan_error_backoff')  # המתנה קצרה במקרה של שגיאה לפני ניסיון נוסף
     
 # === התחלת הבוט ===
 if __name__ == "__main__":